@@ -0,0 +1,85 @@
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, cache=True, fastmath=True)
+def hybrid_mask_kernel(img, min_sat, min_val, min_color_diff):
+    """
+    Fused HSV + pen mask over a uint8 RGB image, computed in a single pass.
+    Values are read as 0-255, so the image must be uint8; convert float images first.
+    :param img: RGB numpy image (H x W x 3, uint8)
+    :param min_sat: Saturation at or below which a pixel is considered gray (0 -> 1)
+    :param min_val: Value at or below which a pixel is considered black (0 -> 1)
+    :param min_color_diff: Green/blue difference above which a pixel is considered pen
+    :return: bool mask, True pixels are neither gray-black nor pen.
+    """
+    height, width = img.shape[0], img.shape[1]
+    out = np.empty((height, width), dtype=np.bool_)
+    for i in prange(height):
+        for j in range(width):
+            r = np.int32(img[i, j, 0])
+            g = np.int32(img[i, j, 1])
+            b = np.int32(img[i, j, 2])
+            mx = max(r, g, b)
+            mn = min(r, g, b)
+            s = 0.0 if mx == 0 else (mx - mn) / mx
+            v = mx / 255.0
+            hsv_bad = (s <= min_sat) or (v <= min_val)
+            pen = ((g > b) and (g - b > min_color_diff)) or (
+                (b > g) and (b - g > min_color_diff)
+            )
+            out[i, j] = not (hsv_bad or pen)
+    return out
+
+
+@njit(parallel=True, cache=True)
+def rgb_to_sv_u8(img, S_out, V_out):
+    """
+    Saturation and value of a uint8 RGB image, in the uint8 domain, computed in one pass.
+    Saturation is rounded up so that `S_out <= t` is exactly `S <= t / 255`.
+    Values are read as 0-255, so the image must be uint8; convert float images first.
+    :param img: RGB numpy image (H x W x 3, uint8)
+    :param S_out: preallocated (H x W) uint8 output for saturation
+    :param V_out: preallocated (H x W) uint8 output for value
+    """
+    height, width = img.shape[0], img.shape[1]
+    for i in prange(height):
+        for j in range(width):
+            r = np.int32(img[i, j, 0])
+            g = np.int32(img[i, j, 1])
+            b = np.int32(img[i, j, 2])
+            mx = max(r, g, b)
+            mn = min(r, g, b)
+            V_out[i, j] = mx
+            S_out[i, j] = 0 if mx == 0 else ((mx - mn) * 255 + mx - 1) // mx
+
+
+@njit(parallel=True, cache=True)
+def rgb_to_hs(img, H_out, S_out):
+    """
+    Hue and saturation of an RGB image in [0, 1], matching skimage.color.rgb2hsv, without the value plane.
+    :param img: RGB numpy image (H x W x 3)
+    :param H_out: preallocated (H x W) float32 output for hue
+    :param S_out: preallocated (H x W) float32 output for saturation
+    """
+    height, width = img.shape[0], img.shape[1]
+    for i in prange(height):
+        for j in range(width):
+            r = np.float32(img[i, j, 0])
+            g = np.float32(img[i, j, 1])
+            b = np.float32(img[i, j, 2])
+            mx = max(r, g, b)
+            delta = mx - min(r, g, b)
+            if delta == 0:
+                H_out[i, j] = 0
+                S_out[i, j] = 0
+                continue
+            # Ties resolve blue > green > red, as in skimage
+            if b == mx:
+                h = 4 + (r - g) / delta
+            elif g == mx:
+                h = 2 + (b - r) / delta
+            else:
+                h = (g - b) / delta
+            H_out[i, j] = (h / 6) % 1
+            S_out[i, j] = delta / mx
@@ -1,13 +1,36 @@
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import zipfile
+from functools import lru_cache
+from pathlib import Path
+
+import cv2
 import numpy as np
-from skimage.filters.rank import maximum
-from skimage.filters import gaussian
 from skimage.morphology.footprints import disk
-from skimage.morphology import remove_small_objects, remove_small_holes
-from skimage.color.colorconv import rgb2hsv
+from skimage.morphology import remove_small_holes
+from skimage.util import img_as_ubyte
 import matplotlib.pyplot as plt
 import yaml
 import tiffslide
 
+from ._masks_nb import hybrid_mask_kernel, rgb_to_hs, rgb_to_sv_u8
+
+# Optional GPU backend for the thumbnail masks (cuCIM + CuPy). Falls back to the CPU path when unavailable.
+try:
+    import cupy as cp
+    from cucim.skimage.color import rgb2hsv as _gpu_rgb2hsv
+    from cucim.skimage.filters import gaussian as _gpu_gaussian
+    from cucim.skimage.morphology import remove_small_holes as _gpu_remove_small_holes
+    from cucim.skimage.util import img_as_float32 as _gpu_img_as_float32
+
+    _CUCIM_IMPORTED = True
+except ImportError:
+    _CUCIM_IMPORTED = False
+
 # RGB Masking (pen) constants
 RGB_RED_CHANNEL = 0
 RGB_GREEN_CHANNEL = 1
@@ -20,6 +43,34 @@ HSV_SAT_CHANNEL = 1
 HSV_VAL_CHANNEL = 2
 MIN_SAT = 20 / 255
 MIN_VAL = 30 / 255
+# Same thresholds in the uint8 domain
+MIN_SAT_U8 = 20
+MIN_VAL_U8 = 30
+# Smoothing before hue thresholding; matches skimage.filters.gaussian defaults (truncate=4, mode="nearest")
+GAUSSIAN_SIGMA = 1
+GAUSSIAN_KSIZE = (2 * int(4 * GAUSSIAN_SIGMA + 0.5) + 1,) * 2
+# Rows per band in hue_range_mask, sized so a band's float planes stay in L2 for typical thumbnail widths
+HUE_MASK_TILE_ROWS = 64
+
+# Config defaults
+CONFIG_DEFAULTS = {
+    "scale": 16,
+    "num_patches": -1,
+    "num_workers": 1,
+    "save_patches": True,
+    "value_map": None,
+    "read_type": "random",
+    "overlap_factor": 0.0,
+}
+
+# Patch size parsing
+_PATCH_SIZE_STRIP = str.maketrans("", "", " []")
+_PATCH_SIZE_SEP_RE = re.compile(r"[,xX*]")
+_MICRON_SUFFIX_RE = re.compile(r"(mu|m)$")
+
+# On-disk cache for generate_initial_mask; bump the version when the masking pipeline changes
+MASK_CACHE_DIR = Path(os.environ.get("OPM_CACHE_DIR", Path.home() / ".cache" / "opm"))
+MASK_CACHE_VERSION = 2
 
 # LAB Masking
 LAB_L_CHANNEL = 0
@@ -29,15 +80,7 @@ LAB_L_THRESHOLD = 0.80
 
 
 def print_sorted_dict(dictionary):
-    sorted_keys = sorted(list(dictionary.keys()))
-    output_str = "{"
-    for index, key in enumerate(sorted_keys):
-        output_str += str(key) + ": " + str(dictionary[key])
-        if index < len(sorted_keys) - 1:
-            output_str += "; "
-    output_str += "}"
-
-    return output_str
+    return "{" + "; ".join(f"{key}: {dictionary[key]}" for key in sorted(dictionary)) + "}"
 
 
 def pass_method(*args):
@@ -67,9 +110,19 @@ def get_patch_class_proportions(image):
     @return: fraction of image that is not zero.
     """
     np_img = np.asarray(image)
-    unique, counts = np.unique(image, return_counts=True)
     denom = np_img.shape[0] * np_img.shape[1]
-    prop_dict = {val: count / denom for val, count in list(zip(unique, counts))}
+    if (
+        np.issubdtype(np_img.dtype, np.integer)
+        and np_img.size > 0
+        and np_img.min() >= 0
+        and np_img.max() < 4096
+    ):
+        # Small label range: count in one pass instead of sorting
+        counts = np.bincount(np_img.ravel().astype(np.intp, copy=False))
+        prop_dict = {int(val): counts[val] / denom for val in np.flatnonzero(counts)}
+    else:
+        unique, counts = np.unique(np_img, return_counts=True)
+        prop_dict = {val: count / denom for val, count in zip(unique, counts)}
     return print_sorted_dict(prop_dict)
 
 
@@ -80,77 +133,213 @@ def map_values(image, dictionary):
     @param dictionary: dict(int => int). Keys in image are swapped to corresponding values.
     @return:
     """
+    if not dictionary:
+        return image.copy()
+
+    # Small non-negative integer label maps with integer keys: one lookup table gather instead of a
+    # mask per key. Float or bool keys would be invalid or boolean indices, so they take the fallback.
+    if (
+        all(
+            isinstance(key, (int, np.integer)) and not isinstance(key, (bool, np.bool_))
+            for key in dictionary
+        )
+        and np.issubdtype(image.dtype, np.integer)
+        and image.size > 0
+        and image.min() >= 0
+        and image.max() < (1 << 16)
+    ):
+        lut = np.arange(int(image.max()) + 1, dtype=image.dtype)
+        for key, value in dictionary.items():
+            if 0 <= key < lut.size:
+                lut[key] = value
+        return lut[image]
+
+    # Anything else: locate each pixel in the sorted keys
+    sorted_keys = sorted(dictionary)
+    keys = np.asarray(sorted_keys)
+    values = np.asarray([dictionary[key] for key in sorted_keys])
+    idx = np.clip(np.searchsorted(keys, image), 0, len(keys) - 1)
+    found = keys[idx] == image
     template = image.copy()  # Copy image so all values not in dict are unmodified
-    for key, value in dictionary.items():
-        template[image == key] = value
+    template[found] = values[idx[found]]
 
     return template
 
 
 def display_overlay(image, mask):
-    overlay = image.copy()
-    overlay[~mask] = (overlay[~mask] // 1.5).astype(np.uint8)
+    image = np.asarray(image)
+    # Darken pixels outside the mask to 2/3 brightness (integer equivalent of x // 1.5)
+    dark = (image.astype(np.uint16) * 2 // 3).astype(np.uint8)
+    overlay = np.where(mask[..., None], image, dark)
     plt.imshow(overlay)
     plt.show()
 
 
-def hue_range_mask(image, min_hue, max_hue, sat_min=0.05):
-    hsv_image = rgb2hsv(image)
-    h_channel = gaussian(hsv_image[:, :, HSV_HUE_CHANNEL])
-    above_min = h_channel > min_hue
-    below_max = h_channel < max_hue
+def _smooth(channel):
+    """
+    Gaussian blur of a single float channel, equivalent to skimage.filters.gaussian with default settings.
+    :param channel: 2D float numpy array
+    :return: blurred float32 array
+    """
+    return cv2.GaussianBlur(
+        channel.astype(np.float32, copy=False),
+        GAUSSIAN_KSIZE,
+        sigmaX=GAUSSIAN_SIGMA,
+        sigmaY=GAUSSIAN_SIGMA,
+        borderType=cv2.BORDER_REPLICATE,
+    )
+
+
+@lru_cache(maxsize=None)
+def _gpu_available():
+    """
+    Whether the cuCIM GPU path can be used. The CUDA device probe is deferred to the first mask
+    computation, so importing this module does not initialise CUDA.
+    """
+    if not _CUCIM_IMPORTED:
+        return False
+    try:
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except RuntimeError:
+        return False
+
+
+def _hue_range_mask_gpu(image, min_hue, max_hue, sat_min):
+    """
+    GPU version of hue_range_mask. All intermediates stay on the device, in float32.
+    :return: cupy bool mask
+    """
+    hsv_image = _gpu_rgb2hsv(_gpu_img_as_float32(cp.asarray(image)))
+    h_channel = _gpu_gaussian(hsv_image[:, :, HSV_HUE_CHANNEL])
+    s_channel = _gpu_gaussian(hsv_image[:, :, HSV_SAT_CHANNEL])
+    return (h_channel > min_hue) & (h_channel < max_hue) & (s_channel > sat_min)
+
+
+def hue_range_mask(image, min_hue, max_hue, sat_min=0.05, tile_rows=HUE_MASK_TILE_ROWS):
+    if _gpu_available():
+        return cp.asnumpy(_hue_range_mask_gpu(image, min_hue, max_hue, sat_min))
+
+    # Process the thumbnail in bands of rows, running HSV -> blur -> threshold on each band
+    # while it is still in cache. Bands are padded by the blur radius so results match a
+    # whole-image pass exactly.
+    image = np.asarray(image)
+    height, width = image.shape[:2]
+    halo = GAUSSIAN_KSIZE[0] // 2
+    h_buffer = np.empty((min(tile_rows + 2 * halo, height), width), dtype=np.float32)
+    s_buffer = np.empty_like(h_buffer)
+    final_mask = np.empty((height, width), dtype=bool)
+
+    for start in range(0, height, tile_rows):
+        end = min(start + tile_rows, height)
+        top = max(start - halo, 0)
+        bottom = min(end + halo, height)
+        h_channel = h_buffer[: bottom - top]
+        s_channel = s_buffer[: bottom - top]
+        rgb_to_hs(image[top:bottom], h_channel, s_channel)
+
+        # Threshold the float32 planes straight into the output band
+        core = slice(start - top, end - top)
+        band_mask = final_mask[start:end]
+        h_channel = _smooth(h_channel)[core]
+        np.greater(h_channel, min_hue, out=band_mask)
+        band_mask &= h_channel < max_hue
+
+        s_channel = _smooth(s_channel)[core]
+        band_mask &= s_channel > sat_min
 
-    s_channel = gaussian(hsv_image[:, :, HSV_SAT_CHANNEL])
-    above_sat = s_channel > sat_min
-    return np.logical_and(np.logical_and(above_min, below_max), above_sat)
+    return final_mask
 
 
 def tissue_mask(image):
     """
     Quick and dirty hue range mask for OPM. Works well on H&E.
+    Runs on the GPU through cuCIM when available.
     TODO: Improve this
     """
+    if _gpu_available():
+        hue_mask = _hue_range_mask_gpu(image, 0.8, 0.99, 0.05)
+        return cp.asnumpy(_gpu_remove_small_holes(hue_mask))
+
     hue_mask = hue_range_mask(image, 0.8, 0.99)
     final_mask = remove_small_holes(hue_mask)
     return final_mask
 
 
+@lru_cache(maxsize=None)
+def _pen_dilation_kernel(pen_mask_expansion):
+    """
+    Structuring element used to expand the pen mask; same footprint as skimage's disk.
+    :param pen_mask_expansion: Radius of the disk in pixels
+    :return: uint8 kernel for cv2.dilate
+    """
+    return disk(pen_mask_expansion).astype(np.uint8)
+
+
 def basic_pen_mask(image, pen_size_threshold, pen_mask_expansion):
-    green_mask = np.bitwise_and(
-        image[:, :, RGB_GREEN_CHANNEL] > image[:, :, RGB_BLUE_CHANNEL],
-        image[:, :, RGB_GREEN_CHANNEL] - image[:, :, RGB_BLUE_CHANNEL]
-        > MIN_COLOR_DIFFERENCE,
+    # MIN_COLOR_DIFFERENCE is in the 0-255 domain, like the HSV masks
+    image = _as_uint8_rgb(image)
+    # "g > b and g - b > t" or "b > g and b - g > t" is exactly |g - b| > t
+    color_diff = np.subtract(
+        image[:, :, RGB_GREEN_CHANNEL], image[:, :, RGB_BLUE_CHANNEL], dtype=np.int16
     )
-
-    blue_mask = np.bitwise_and(
-        image[:, :, RGB_BLUE_CHANNEL] > image[:, :, RGB_GREEN_CHANNEL],
-        image[:, :, RGB_BLUE_CHANNEL] - image[:, :, RGB_GREEN_CHANNEL]
-        > MIN_COLOR_DIFFERENCE,
+    masked_pen = np.abs(color_diff, out=color_diff) > MIN_COLOR_DIFFERENCE
+    # Drop pen components smaller than pen_size_threshold (4-connectivity, like remove_small_objects)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(
+        masked_pen.astype(np.uint8), connectivity=4
     )
+    keep = stats[:, cv2.CC_STAT_AREA] >= pen_size_threshold
+    keep[0] = False  # background
+    new_mask_image = keep[labels]
 
-    masked_pen = np.bitwise_or(green_mask, blue_mask)
-    new_mask_image = remove_small_objects(masked_pen, pen_size_threshold)
+    return cv2.dilate(
+        new_mask_image.astype(np.uint8), _pen_dilation_kernel(pen_mask_expansion)
+    ).astype(bool)
 
-    return maximum(np.where(new_mask_image, 1, 0), disk(pen_mask_expansion)).astype(
-        bool
-    )
+
+def _as_uint8_rgb(image):
+    """
+    The uint8-domain mask kernels read pixel values as 0-255; convert anything else with img_as_ubyte.
+    """
+    image = np.asarray(image)
+    if image.dtype != np.uint8:
+        image = img_as_ubyte(image)
+    return image
 
 
-def basic_hsv_mask(image):
+def basic_hsv_mask(image, s_buffer=None, v_buffer=None):
     """
     Mask based on low saturation and value (gray-black colors)
-    :param image: RGB numpy image
+    :param image: RGB numpy image; non-uint8 input (e.g. float in [0, 1]) is converted to uint8
+    :param s_buffer: Optional preallocated (H x W) uint8 array for saturation, reused between calls
+    :param v_buffer: Optional preallocated (H x W) uint8 array for value, reused between calls
     :return: image mask, True pixels are gray-black.
     """
-    hsv_image = rgb2hsv(image)
-    return np.bitwise_or(
-        hsv_image[:, :, HSV_SAT_CHANNEL] <= MIN_SAT,
-        hsv_image[:, :, HSV_VAL_CHANNEL] <= MIN_VAL,
-    )
+    image = _as_uint8_rgb(image)
+    if s_buffer is None:
+        s_buffer = np.empty(image.shape[:2], dtype=np.uint8)
+    if v_buffer is None:
+        v_buffer = np.empty(image.shape[:2], dtype=np.uint8)
+    # The kernel does not bounds-check, so mismatched buffers would write out of bounds
+    for buffer in (s_buffer, v_buffer):
+        if buffer.shape != image.shape[:2] or buffer.dtype != np.uint8:
+            raise ValueError(
+                "s_buffer and v_buffer must be uint8 arrays of shape {}, got {} {}.".format(
+                    image.shape[:2], buffer.dtype, buffer.shape
+                )
+            )
+    rgb_to_sv_u8(image, s_buffer, v_buffer)
+    return np.bitwise_or(s_buffer <= MIN_SAT_U8, v_buffer <= MIN_VAL_U8)
 
 
 def hybrid_mask(image):
-    return ~np.bitwise_or(basic_hsv_mask(image), basic_pen_mask(image))
+    """
+    Combined HSV and pen mask, evaluated per pixel in a single fused pass.
+    :param image: RGB numpy image; non-uint8 input (e.g. float in [0, 1]) is converted to uint8
+    :return: image mask, True pixels are neither gray-black nor pen.
+    """
+    return hybrid_mask_kernel(
+        _as_uint8_rgb(image), MIN_SAT, MIN_VAL, MIN_COLOR_DIFFERENCE
+    )
 
 
 def trim_mask(image, mask, background_value=0, mask_func=hybrid_mask):
@@ -162,10 +351,8 @@ def trim_mask(image, mask, background_value=0, mask_func=hybrid_mask):
     :param mask_func: Func which takes `image` as a parameter. Returns a binary mask, `True` will be background.
     :return: `mask` with excess trimmed off
     """
-    mask_copy = mask.copy()
-    masked_image = mask_func(image)
-    mask_copy[masked_image] = background_value
-    return mask_copy
+    mask = np.asarray(mask)
+    return np.where(mask_func(image), mask.dtype.type(background_value), mask)
 
 
 def patch_size_check(img, patch_height, patch_width):
@@ -186,7 +373,8 @@ def alpha_channel_check(img):
     elif len(img.shape) == 3 and img.shape[-1] == 4:
         alpha_channel = img[:, :, 3]
 
-        if np.any(alpha_channel != 255):
+        # Single reduction, no H x W boolean temporary
+        if alpha_channel.min() != 255:
             return False
         else:
             return True
@@ -198,57 +386,252 @@ def alpha_channel_check(img):
         return False
 
 
+class _ConfigLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+    """
+    Safe YAML loader (libyaml-backed when available) that still accepts the
+    `!!python/list` and `!!python/tuple` tags used in existing config files.
+    """
+
+
+_ConfigLoader.add_constructor(
+    "tag:yaml.org,2002:python/list",
+    lambda loader, node: loader.construct_sequence(node, deep=True),
+)
+_ConfigLoader.add_constructor(
+    "tag:yaml.org,2002:python/tuple",
+    lambda loader, node: tuple(loader.construct_sequence(node, deep=True)),
+)
+
+
 def parse_config(config_file):
     """
     Parse config file and return a dictionary of config values.
     :param config_file: path to config file
     :return: dictionary of config values
     """
-    config = yaml.load(open(config_file), Loader=yaml.FullLoader)
+    with open(config_file) as f:
+        config = yaml.load(f, Loader=_ConfigLoader)
 
     # initialize defaults
-    if not ("scale" in config):
-        config["scale"] = 16
-    if not ("num_patches" in config):
-        config["num_patches"] = -1
-    if not ("num_workers" in config):
-        config["num_workers"] = 1
-    if not ("save_patches" in config):
-        config["save_patches"] = True
-    if not ("value_map" in config):
-        config["value_map"] = None
-    if not ("read_type" in config):
-        config["read_type"] = "random"
-    if not ("overlap_factor" in config):
-        config["overlap_factor"] = 0.0
+    config = {**CONFIG_DEFAULTS, **config}
 
     return config
 
 
-def generate_initial_mask(slide_path, scale):
+class SlideContext:
+    """
+    A slide opened once and shared between mask generation and patch size computation.
+    Keeps the slide properties, its microns-per-pixel and the last decoded thumbnail.
+    """
+
+    __slots__ = ("path", "slide", "properties", "_mpp", "_thumbnail", "_thumbnail_scale")
+
+    def __init__(self, slide_path):
+        self.path = slide_path
+        self.slide = tiffslide.open_slide(slide_path)
+        self.properties = self.slide.properties
+        self._mpp = None
+        self._thumbnail = None
+        self._thumbnail_scale = None
+
+    def mpp(self):
+        """
+        :return: (mpp_x, mpp_y) of the slide; -1 where not available.
+        """
+        if self._mpp is None:
+            self._mpp = _mpp_from_properties(self.properties)
+        return self._mpp
+
+    def thumbnail(self, scale):
+        """
+        Thumbnail of the slide downsampled by `scale`, decoded once per scale.
+        :param scale: Downsampling factor
+        :return: RGB numpy image
+        """
+        if self._thumbnail_scale != scale:
+            slide_dims = self.slide.dimensions
+            self._thumbnail = np.asarray(
+                self.slide.get_thumbnail((slide_dims[0] // scale, slide_dims[1] // scale))
+            )
+            self._thumbnail_scale = scale
+        return self._thumbnail
+
+
+def pack_mask(mask):
+    """
+    Pack a 2D bool mask into bits along the rows (8 pixels per byte), for storing or passing masks around.
+    :param mask: 2D bool numpy array
+    :return: 2D uint8 numpy array of shape (H, ceil(W / 8))
+    """
+    return np.packbits(mask, axis=-1)
+
+
+def unpack_mask(packed_mask, width):
+    """
+    Inverse of pack_mask.
+    :param packed_mask: Output of pack_mask, or any row-slice of it
+    :param width: Width of the original mask
+    :return: 2D bool numpy array of shape (H, width)
+    """
+    return np.unpackbits(packed_mask, axis=-1, count=int(width)).view(bool)
+
+
+def _mask_cache_file(slide_path, scale):
+    """
+    Location of the cached initial mask for a slide; changes whenever the slide file is modified.
+    """
+    slide_path = os.path.abspath(slide_path)
+    key = hashlib.sha1(
+        "{}|{}|{}|{}".format(
+            slide_path, os.path.getmtime(slide_path), scale, MASK_CACHE_VERSION
+        ).encode()
+    ).hexdigest()
+    return MASK_CACHE_DIR / "{}.npz".format(key)
+
+
+def _load_cached_mask(cache_file):
+    """
+    Load a cached (mask, real_scale) pair. Missing or unreadable cache files count as a miss.
+    :return: (mask, real_scale), or None on a cache miss
+    """
+    try:
+        with np.load(cache_file) as cached:
+            mask = unpack_mask(cached["mask"], cached["width"])
+            return mask, tuple(cached["scale"].tolist())
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile, KeyError):
+        return None
+
+
+def _save_cached_mask(cache_file, mask, real_scale):
+    """
+    Store (mask, real_scale) in the cache. The file is written to a temporary name and moved into
+    place, so readers never see a partial file. Caching is best effort, e.g. read-only home directory.
+    """
+    tmp_path = None
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=cache_file.parent, suffix=".tmp", delete=False
+        ) as tmp_file:
+            tmp_path = tmp_file.name
+            np.savez_compressed(
+                tmp_file,
+                mask=pack_mask(mask),
+                width=mask.shape[1],
+                scale=np.asarray(real_scale),
+            )
+        os.replace(tmp_path, cache_file)
+    except OSError:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def generate_initial_mask(slide_path, scale, use_cache=True, ctx=None):
     """
     Helper method to generate random coordinates within a slide
     :param slide_path: Path to slide (str)
-    :param num_patches: Number of patches you want to generate
-    :return: list of n (x,y) coordinates
+    :param scale: Downsampling factor of the thumbnail the mask is computed on
+    :param use_cache: Load/store the result under MASK_CACHE_DIR, keyed by slide path, mtime and scale
+    :param ctx: Optional SlideContext for `slide_path`, so the slide and its thumbnail are shared with other calls
+    :return: tissue mask of the thumbnail, (x, y) scale of the thumbnail relative to the slide
     """
+    if use_cache:
+        cache_file = _mask_cache_file(slide_path, scale)
+        cached = _load_cached_mask(cache_file)
+        if cached is not None:
+            return cached
+
     # Open slide and get properties
-    slide = tiffslide.open_slide(slide_path)
-    slide_dims = slide.dimensions
+    if ctx is None:
+        ctx = SlideContext(slide_path)
+    slide_dims = ctx.slide.dimensions
 
     # Call thumbnail for effiency, calculate scale relative to whole slide
-    slide_thumbnail = np.asarray(
-        slide.get_thumbnail((slide_dims[0] // scale, slide_dims[1] // scale))
-    )
+    slide_thumbnail = ctx.thumbnail(scale)
     real_scale = (
         slide_dims[0] / slide_thumbnail.shape[1],
         slide_dims[1] / slide_thumbnail.shape[0],
     )
 
-    return tissue_mask(slide_thumbnail), real_scale
+    mask = tissue_mask(slide_thumbnail)
+
+    if use_cache:
+        _save_cached_mask(cache_file, mask, real_scale)
+
+    return mask, real_scale
+
+
+def _generate_initial_mask_worker(args):
+    """
+    Top-level (picklable) wrapper so generate_initial_mask can run in a process pool.
+    """
+    return generate_initial_mask(*args)
+
+
+def generate_initial_masks(slide_paths, scale, num_workers=CONFIG_DEFAULTS["num_workers"]):
+    """
+    Generate initial masks for several slides in parallel, one slide per worker process.
+    :param slide_paths: Paths to slides (list of str)
+    :param scale: Downsampling factor of the thumbnail the masks are computed on
+    :param num_workers: Number of worker processes, usually config["num_workers"]
+    :return: dict of slide path => (mask, real_scale), as returned by generate_initial_mask
+    """
+    # Each slide once, so duplicates don't race on the same cache file
+    slide_paths = list(dict.fromkeys(slide_paths))
+    # Spawned workers start with a clean CUDA state, so the GPU path works in them
+    with concurrent.futures.ProcessPoolExecutor(
+        num_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        results = executor.map(
+            _generate_initial_mask_worker,
+            [(slide_path, scale) for slide_path in slide_paths],
+            chunksize=1,
+        )
+        return dict(zip(slide_paths, results))
 
 
-def get_patch_size_in_microns(input_slide_path, patch_size_from_config, verbose=False):
+def _first_property(metadata, names):
+    """
+    Return the first property in `names` that is set in the slide metadata, or -1 if none are.
+    """
+    for name in names:
+        if metadata.get(name) is not None:
+            return metadata[name]
+    return -1
+
+
+@lru_cache(maxsize=256)
+def _slide_mpp(input_slide_path):
+    """
+    Read the microns-per-pixel of a slide, opening it only once per process.
+    :param input_slide_path: Path to slide (str)
+    :return: (mpp_x, mpp_y); -1 where not available. Missing y falls back to x.
+    """
+    return _mpp_from_properties(tiffslide.open_slide(input_slide_path).properties)
+
+
+def _mpp_from_properties(metadata):
+    """
+    Microns-per-pixel from slide properties.
+    :param metadata: tiffslide properties of the slide
+    :return: (mpp_x, mpp_y); -1 where not available. Missing y falls back to x.
+    """
+    mpp_x = _first_property(
+        metadata, [tiffslide.PROPERTY_NAME_MPP_X, "tiff.XResolution", "XResolution"]
+    )
+    mpp_y = _first_property(
+        metadata, [tiffslide.PROPERTY_NAME_MPP_Y, "tiff.YResolution", "YResolution"]
+    )
+    if mpp_y == -1:
+        # if y-axis data is missing, use x-axis data
+        mpp_y = mpp_x
+    return mpp_x, mpp_y
+
+
+def get_patch_size_in_microns(input_slide_path, patch_size_from_config, verbose=False, ctx=None):
     """
     This function takes a slide path and a patch size in microns and returns the patch size in pixels.
 
@@ -256,6 +639,7 @@ def get_patch_size_in_microns(input_slide_path, patch_size_from_config, verbose=
         input_slide_path (str): The input WSI path.
         patch_size_from_config (str): The patch size in microns.
         verbose (bool): Whether to provide verbose prints.
+        ctx (SlideContext): Already opened slide to read the mpp from, instead of opening input_slide_path.
 
     Raises:
         ValueError: If the patch size is not a valid number in microns.
@@ -268,18 +652,10 @@ def get_patch_size_in_microns(input_slide_path, patch_size_from_config, verbose=
     patch_size = None
 
     if isinstance(patch_size_from_config, str):
-        # first remove all spaces and square brackets
-        patch_size_from_config = patch_size_from_config.replace(" ", "")
-        patch_size_from_config = patch_size_from_config.replace("[", "")
-        patch_size_from_config = patch_size_from_config.replace("]", "")
-        # try different split strategies
-        patch_size = patch_size_from_config.split(",")
-        if len(patch_size) == 1:
-            patch_size = patch_size_from_config.split("x")
-        if len(patch_size) == 1:
-            patch_size = patch_size_from_config.split("X")
-        if len(patch_size) == 1:
-            patch_size = patch_size_from_config.split("*")
+        # first remove all spaces and square brackets, then split on any supported separator
+        patch_size = _PATCH_SIZE_SEP_RE.split(
+            patch_size_from_config.translate(_PATCH_SIZE_STRIP)
+        )
         if len(patch_size) == 1:
             raise ValueError(
                 "Could not parse patch size from config.yml, use either ',', 'x', 'X', or '*' as separator between x and y dimensions."
@@ -289,38 +665,23 @@ def get_patch_size_in_microns(input_slide_path, patch_size_from_config, verbose=
     else:
         raise ValueError("Patch size must be a list or string.")
 
-    magnification_prev = -1
     for i in range(len(patch_size)):
-        magnification = -1
         if str(patch_size[i]).isnumeric():
             return_patch_size[i] = int(patch_size[i])
         elif isinstance(patch_size[i], str):
-            if ("m" in patch_size[i]) or ("mu" in patch_size[i]):
+            micron_suffix = _MICRON_SUFFIX_RE.search(patch_size[i])
+            if micron_suffix:
                 if verbose:
                     print(
                         "Using mpp to calculate patch size for dimension {}".format(i)
                     )
-                # only enter if "m" is present in patch size
-                input_slide = tiffslide.open_slide(input_slide_path)
-                metadata = input_slide.properties
-                if i == 0:
-                    for property in [tiffslide.PROPERTY_NAME_MPP_X, "tiff.XResolution", "XResolution"]:
-                        if property in metadata:
-                            magnification = metadata[property]
-                            magnification_prev = magnification
-                            break                        
-                elif i == 1:
-                    for property in [tiffslide.PROPERTY_NAME_MPP_Y, "tiff.YResolution", "YResolution"]:
-                        if property in metadata:
-                            magnification = metadata[property]
-                            break 
-                    if magnification == -1:
-                        # if y-axis data is missing, use x-axis data
-                        magnification = magnification_prev
+                # only enter if "m" is present in patch size; slide is opened once per path
+                if ctx is not None:
+                    magnification = ctx.mpp()[i]
+                else:
+                    magnification = _slide_mpp(input_slide_path)[i]
                 # get patch size in pixels
-                # check for 'mu' first
-                size_in_microns = patch_size[i].replace("mu", "")
-                size_in_microns = float(size_in_microns.replace("m", ""))
+                size_in_microns = float(patch_size[i][: micron_suffix.start()])
                 if verbose:
                     print(
                         "Original patch size in microns for dimension {}",
@@ -328,7 +689,6 @@ def get_patch_size_in_microns(input_slide_path, patch_size_from_config, verbose=
                     )
                 if magnification > 0:
                     return_patch_size[i] = round(size_in_microns / magnification)
-                    magnification_prev = magnification
             else:
                 return_patch_size[i] = float(patch_size[i])
 
@@ -10,7 +10,7 @@ from PIL import Image
 from pathlib import Path
 from functools import partial
 from opm.patch_manager import PatchManager
-from opm.utils import alpha_channel_check, patch_size_check, parse_config, generate_initial_mask, get_patch_size_in_microns
+from opm.utils import alpha_channel_check, patch_size_check, parse_config, generate_initial_mask, get_patch_size_in_microns, SlideContext
 
 Image.MAX_IMAGE_PIXELS = None
 warnings.simplefilter("ignore")
@@ -64,14 +64,18 @@ if __name__ == '__main__':
     cfg = parse_config(args.config)
 
     if args.input_csv is None:
+        # Open the slide once for both the mask and the mpp lookup
+        slide_ctx = SlideContext(slide_path)
         # Generate an initial validity mask
-        mask, scale = generate_initial_mask(slide_path, cfg['scale'])
+        mask, scale = generate_initial_mask(slide_path, cfg['scale'], ctx=slide_ctx)
         manager.set_valid_mask(mask, scale)
         if args.label_map_path is not None:
             manager.set_label_map(args.label_map_path)
         
         ## trying to handle mpp
-        cfg['patch_size'] = get_patch_size_in_microns(slide_path, cfg['patch_size'], True)
+        cfg['patch_size'] = get_patch_size_in_microns(slide_path, cfg['patch_size'], True, ctx=slide_ctx)
+        # Release the slide handle and decoded thumbnail before mining
+        del slide_ctx
 
         # Reject patch if any pixels are transparent
         manager.add_patch_criteria(alpha_channel_check)
@@ -17,6 +17,8 @@ requirements = [
     'tifffile',
     'tiffslide',
     'imagecodecs',
+    'numba',
+    'opencv-python-headless',
 ]
 
 setup(